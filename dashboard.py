@@ -1,21 +1,66 @@
+import base64
+import io
+import json
+import os
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from sqlalchemy import create_engine
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.colors import hex_to_rgb
+import pydeck as pdk
+from PIL import Image
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import create_engine, text
 import numpy as np
 from st_aggrid import AgGrid, GridOptionsBuilder, JsCode
 from st_aggrid.grid_options_builder import GridOptionsBuilder
 
-# Configuración de la página
-st.set_page_config(
-    page_title="Real Estate Analytics",
-    page_icon="🏠",
-    layout="wide",
-    initial_sidebar_state="expanded"
+# Columnas que usa el dashboard; solo estas se piden a la base de datos
+REQUIRED_COLUMNS = (
+    'Address', 'Price', 'Size', 'Occupancy', 'Comarca', 'Barrio',
+    'Rentability Index', 'Payback Period', 'lat', 'lon', 'Link',
+    'Avg Annual Rev', 'Station Name', 'Walking Distance', 'Avg Daily Rate',
 )
-
-# Estilos CSS personalizados
-st.markdown("""
+# Columnas numéricas y su tipo; float32 salvo los importes en yenes,
+# que superan la precisión de float32 (24 bits de mantisa)
+NUMERIC_DTYPES = {
+    'Price': 'float64',
+    'Avg Annual Rev': 'float64',
+    'Size': 'float32',
+    'Rentability Index': 'float32',
+    'Payback Period': 'float32',
+    'lat': 'float32',
+    'lon': 'float32',
+}
+# Máximo de puntos que se envían a los gráficos de dispersión y al mapa
+MAX_PLOT_POINTS = 5_000
+# Máximo de filas que se envían a la tabla de detalle
+MAX_TABLE_ROWS = 1_000
+# Mínimo de puntos por estado de ocupación en la muestra de los gráficos
+MIN_POINTS_PER_GROUP = 100
+# Resolución (ancho, alto) del mapa rasterizado cuando hay más puntos
+MAP_RASTER_SIZE = (600, 400)
+# Propiedades más rentables que se dibujan como puntos sobre el mapa rasterizado
+MAP_TOP_POINTS = 200
+# Columnas que usan los gráficos; la tabla de detalle usa todas
+PLOT_COLUMNS = [
+    'Price', 'Rentability Index', 'Payback Period', 'Size',
+    'Occupancy', 'lat', 'lon', 'Address',
+]
+# Columnas de pocos valores distintos, se guardan como category
+CATEGORY_COLUMNS = ('Occupancy', 'Comarca', 'Barrio')
+# Filas por bloque al leer de la base de datos
+READ_CHUNKSIZE = 10_000
+# Segundos que se mantienen en caché los datos de la base de datos
+CACHE_TTL = 3600
+# Combinaciones de filtros distintas que se mantienen en caché
+CACHE_MAX_ENTRIES = 64
+
+# Estilos CSS de las tarjetas de métricas
+STYLE = """
     <style>
     .metric-card {
         border: 1px solid #ccc;
@@ -28,8 +73,37 @@ st.markdown("""
         font-weight: bold;
         color: #1f77b4;
     }
+    .kpi-row {
+        display: flex;
+        gap: 1rem;
+        margin-bottom: 1rem;
+    }
+    .kpi-row .metric-card {
+        flex: 1;
+    }
+    .delta-up {
+        color: #09ab3b;
+    }
+    .delta-down {
+        color: #ff2b2b;
+    }
     </style>
-""", unsafe_allow_html=True)
+"""
+
+# Serializar las figuras de Plotly con orjson, mucho más rápido que json
+pio.json.config.default_engine = 'orjson'
+
+# Configuración de la página
+st.set_page_config(
+    page_title="Real Estate Analytics",
+    page_icon="🏠",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Estilos CSS personalizados; se envían en cada rerun porque Streamlit
+# solo conserva los elementos que emite cada ejecución
+st.markdown(STYLE, unsafe_allow_html=True)
 
 # Función para la conexión a la base de datos
 @st.cache_resource
@@ -40,41 +114,550 @@ def get_database_connection():
             f"postgresql://{credentials['user']}:{credentials['password']}@"
             f"{credentials['host']}:{credentials['port']}/{credentials['database']}"
         )
-        engine = create_engine(connection_string)
+        # Pool fijo compartido por todas las sesiones: las consultas se
+        # cachean y cada rerun usa como mucho una conexión.
+        # pool_pre_ping y pool_recycle evitan conexiones cerradas por el
+        # servidor tras un periodo de inactividad
+        engine = create_engine(
+            connection_string,
+            pool_size=4,
+            max_overflow=0,
+            pool_pre_ping=True,
+            pool_recycle=1800,
+            connect_args={
+                'application_name': 'streamlit_dashboard',
+                'options': '-c statement_timeout=15000',
+            }
+        )
         return engine
     except Exception as e:
         st.error(f"Error conectando a la base de datos: {str(e)}")
         return None
 
-# Función para cargar datos
-@st.cache_data
-def load_data():
-    engine = get_database_connection()
-    if engine is None:
+# Función para obtener la ruta del snapshot Parquet (ver refresh_snapshot.py)
+# Se usa si está configurado en los secrets ([snapshot] path = "...") y el
+# fichero existe; si no, los datos se leen de Postgres
+def snapshot_path():
+    try:
+        ruta = st.secrets["snapshot"]["path"]
+    except (KeyError, FileNotFoundError):
+        return None
+    return ruta if os.path.exists(ruta) else None
+
+# Función para cargar los valores disponibles en los filtros
+# Agrupa por Comarca/Barrio/Ocupación para obtener en una sola consulta
+# las opciones del sidebar, el rango de precios y los totales globales
+@st.cache_data(ttl=CACHE_TTL)
+def load_facets():
+    ruta = snapshot_path()
+    engine = None if ruta is not None else get_database_connection()
+    if ruta is None and engine is None:
         return pd.DataFrame()
     try:
-        df = pd.read_sql('SELECT * FROM properties', engine)
-        # Convertir coordenadas a lat/lon si existen
-        if 'Coordinates' in df.columns:
-            df[['lat', 'lon']] = df['Coordinates'].str.split(',', expand=True).astype(float, errors='ignore')
-        return df
+        if ruta is not None:
+            # Los mismos agregados que la consulta SQL, sobre el snapshot
+            tabla = pq.read_table(
+                ruta,
+                columns=['Comarca', 'Barrio', 'Occupancy', 'Price', 'Rentability Index', 'Payback Period', 'lat', 'lon']
+            ).to_pandas()
+            tabla = tabla.astype({'lat': 'float64', 'lon': 'float64'})
+            facets = tabla.groupby(['Comarca', 'Barrio', 'Occupancy'], dropna=False).agg(
+                min_price=('Price', 'min'),
+                max_price=('Price', 'max'),
+                sum_price=('Price', 'sum'),
+                sum_rent=('Rentability Index', 'sum'),
+                sum_payback=('Payback Period', 'sum'),
+                sum_lat=('lat', 'sum'),
+                sum_lon=('lon', 'sum'),
+                n_coords=('lat', 'count'),
+                n=('Price', 'size'),
+            ).reset_index()
+        else:
+            query = text('''
+                SELECT "Comarca",
+                       "Barrio",
+                       COALESCE("Occupancy", 'Unknown') AS "Occupancy",
+                       MIN(COALESCE("Price", 0)) AS min_price,
+                       MAX(COALESCE("Price", 0)) AS max_price,
+                       SUM(COALESCE("Price", 0)) AS sum_price,
+                       SUM(COALESCE("Rentability Index", 0)) AS sum_rent,
+                       SUM(COALESCE("Payback Period", 0)) AS sum_payback,
+                       SUM("lat") AS sum_lat,
+                       SUM("lon") AS sum_lon,
+                       COUNT("lat") AS n_coords,
+                       COUNT(*) AS n
+                FROM properties
+                GROUP BY 1, 2, 3
+            ''')
+            facets = pd.read_sql(query, engine)
+        for c in CATEGORY_COLUMNS:
+            facets[c] = facets[c].astype('category')
+        return facets
     except Exception as e:
-        st.error(f"Error cargando datos: {str(e)}")
+        st.error(f"Error cargando filtros: {str(e)}")
         return pd.DataFrame()
 
-# Cargar datos
-df = load_data()
+# Tabla vacía con las mismas columnas que devuelve load_filtered
+def empty_properties():
+    return pd.DataFrame(columns=list(REQUIRED_COLUMNS))
+
+# Consulta de propiedades para una combinación de condiciones
+def properties_query(con_precio, con_ocupacion, con_comarca, con_barrios):
+    # Solo se añaden las condiciones que descartan filas
+    condiciones = []
+    if con_precio:
+        condiciones.append('COALESCE("Price", 0) BETWEEN :min_p AND :max_p')
+    if con_ocupacion:
+        condiciones.append('''COALESCE("Occupancy", 'Unknown') = ANY(:ocupacion)''')
+    if con_comarca:
+        condiciones.append('"Comarca" = :comarca')
+    if con_barrios:
+        condiciones.append('"Barrio" = ANY(:barrios)')
+    else:
+        condiciones.append('"Barrio" IS NOT NULL')
+    columnas = ', '.join(f'"{c}"' for c in REQUIRED_COLUMNS)
+    return text(
+        f'SELECT {columnas} FROM properties WHERE ' + ' AND '.join(condiciones)
+    )
+
+# Función para leer de Postgres las propiedades que cumplen los filtros
+def read_database(engine, min_p, max_p, ocupacion, comarca, barrios):
+    # None significa que no hay filtro (todas las opciones seleccionadas)
+    params = {}
+    if min_p is not None:
+        params.update(min_p=min_p, max_p=max_p)
+    if ocupacion is not None:
+        # psycopg2 adapta listas (no tuplas) a ARRAY
+        params['ocupacion'] = list(ocupacion)
+    if comarca is not None:
+        params['comarca'] = comarca
+    if barrios is not None:
+        params['barrios'] = list(barrios)
+    query = properties_query(
+        min_p is not None,
+        ocupacion is not None,
+        comarca is not None,
+        barrios is not None
+    )
+    # Cursor del lado del servidor: las filas llegan por bloques en lugar
+    # de cargarse todas en memoria como tuplas antes de crear el DataFrame
+    with engine.connect().execution_options(yield_per=READ_CHUNKSIZE) as conn:
+        chunks = pd.read_sql(
+            query,
+            conn,
+            params=params,
+            chunksize=READ_CHUNKSIZE,
+            # Texto en buffers Arrow en lugar de objetos Python
+            dtype_backend='pyarrow',
+            dtype=NUMERIC_DTYPES
+        )
+        return pd.concat(chunks, ignore_index=True)
+
+# Función para leer del snapshot Parquet las propiedades que cumplen los filtros
+# pyarrow aplica los filtros durante la lectura y solo lee las columnas usadas
+def read_snapshot(ruta, min_p, max_p, ocupacion, comarca, barrios):
+    # El snapshot ya tiene Occupancy y Price sin nulos
+    condicion = pc.field('Barrio').is_valid()
+    if min_p is not None:
+        condicion &= (pc.field('Price') >= min_p) & (pc.field('Price') <= max_p)
+    # Los conjuntos de valores llevan tipo: una lista vacía se inferiría
+    # como null y pyarrow la rechaza frente a una columna de texto
+    if ocupacion is not None:
+        condicion &= pc.field('Occupancy').isin(pa.array(list(ocupacion), type=pa.string()))
+    if comarca is not None:
+        condicion &= pc.field('Comarca') == comarca
+    if barrios is not None:
+        condicion &= pc.field('Barrio').isin(pa.array(list(barrios), type=pa.string()))
+    tabla = pq.read_table(ruta, columns=list(REQUIRED_COLUMNS), filters=condicion)
+    return tabla.to_pandas(types_mapper=pd.ArrowDtype).astype(NUMERIC_DTYPES)
+
+# Función para cargar las propiedades que cumplen los filtros
+# Los filtros se aplican en Postgres (o al leer el snapshot) para traer solo
+# las filas seleccionadas
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_filtered(min_p, max_p, ocupacion, comarca, barrios):
+    ruta = snapshot_path()
+    engine = None if ruta is not None else get_database_connection()
+    if ruta is None and engine is None:
+        return empty_properties()
+    try:
+        if ruta is not None:
+            df = read_snapshot(ruta, min_p, max_p, ocupacion, comarca, barrios)
+        else:
+            df = read_database(engine, min_p, max_p, ocupacion, comarca, barrios)
+        # Manejo de valores nulos
+        df['Occupancy'] = df['Occupancy'].fillna('Unknown')
+        df['Price'] = df['Price'].fillna(0)
+        df['Rentability Index'] = df['Rentability Index'].fillna(0)
+        df['Payback Period'] = df['Payback Period'].fillna(0)
+        for c in CATEGORY_COLUMNS:
+            df[c] = df[c].astype('category')
+        # Las asignaciones anteriores dejan los bloques de pandas fragmentados;
+        # copy() los consolida para que cada columna numérica sea contigua
+        return df.copy()
+    except Exception as e:
+        st.error(f"Error cargando datos: {str(e)}")
+        return empty_properties()
+
+# Función para calcular las métricas principales de la selección
+# Se cachea por filtros para no recalcular las medias en cada rerun.
+# _df es la tabla de load_filtered(*filtros) que ya tiene el script: con el
+# prefijo _ Streamlit no la hashea y la clave de la caché son solo los
+# filtros, así no se deserializa otra copia de la tabla en cada función
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def compute_metrics(_df, min_p, max_p, ocupacion, comarca, barrios):
+    n = len(_df)
+    # Las tres medias en una sola pasada sobre una matriz float64 (acumular
+    # en float32 perdería precisión con precios de cientos de millones)
+    valores = _df[['Price', 'Rentability Index', 'Payback Period']].to_numpy(dtype=np.float64)
+    medias = valores.sum(axis=0) / n if n else np.full(3, np.nan)
+    return {
+        'n': n,
+        'price': medias[0],
+        'rent': medias[1],
+        'payback': medias[2],
+    }
+
+# Función para calcular los valores de toda la tabla que usa la interfaz:
+# opciones de los filtros, rango de precios y medias para las métricas.
+# No dependen de los filtros, se calculan una vez por carga de datos
+@st.cache_data(ttl=CACHE_TTL)
+def dataset_stats():
+    facets = load_facets()
+    if facets.empty:
+        return None
+    n = facets['n'].sum()
+    sumas = facets[['sum_price', 'sum_rent', 'sum_payback']].sum()
+    # Las categorías ya están ordenadas y sin nulos
+    opciones = {c: tuple(facets[c].cat.categories) for c in CATEGORY_COLUMNS}
+    paleta = px.colors.qualitative.Plotly
+    return {
+        'opciones': opciones,
+        # Un color fijo por estado de ocupación, el mismo con cualquier filtro
+        'colores_ocupacion': {
+            v: paleta[i % len(paleta)] for i, v in enumerate(opciones['Occupancy'])
+        },
+        'min_price': int(facets['min_price'].min() or 0),
+        'max_price': int(facets['max_price'].max() or 0),
+        # Centro de todas las propiedades con coordenadas, para el mapa
+        'centro': (
+            float(facets['sum_lat'].sum() / facets['n_coords'].sum()),
+            float(facets['sum_lon'].sum() / facets['n_coords'].sum()),
+        ) if facets['n_coords'].sum() else None,
+        'medias': {
+            'n': int(n),
+            'price': sumas['sum_price'] / n,
+            'rent': sumas['sum_rent'] / n,
+            'payback': sumas['sum_payback'] / n,
+        },
+    }
+
+# Función para calcular los histogramas de precio y rentabilidad
+# Se cachea por filtros: los bins se calculan una vez por selección y no en
+# cada rerun (cambio de pestaña, columnas de la tabla, etc.)
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def compute_histograms(_df, min_p, max_p, ocupacion, comarca, barrios):
+    return {
+        c: np.histogram(_df[c].to_numpy(dtype=np.float64), bins=50)
+        for c in ('Price', 'Rentability Index')
+    }
+
+# Función para obtener la muestra de puntos de los gráficos de dispersión
+# y del mapa; más puntos no aportan nada en pantalla
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_plot_sample(_df, min_p, max_p, ocupacion, comarca, barrios):
+    # Se seleccionan filas y columnas en un solo paso para copiar solo lo necesario
+    plot_cols = _df.columns.get_indexer(PLOT_COLUMNS)
+    if len(_df) <= MAX_PLOT_POINTS:
+        return _df.iloc[:, plot_cols]
+    # Muestra estratificada por ocupación: cada estado aporta en proporción a
+    # su tamaño, con un mínimo para que los estados poco frecuentes se vean
+    rng = np.random.default_rng(0)
+    fraccion = MAX_PLOT_POINTS / len(_df)
+    plot_rows = np.concatenate([
+        rng.choice(
+            posiciones,
+            min(len(posiciones), max(MIN_POINTS_PER_GROUP, round(len(posiciones) * fraccion))),
+            replace=False
+        )
+        for posiciones in _df.groupby('Occupancy', observed=True).indices.values()
+    ])
+    return _df.iloc[plot_rows, plot_cols]
+
+# Función para construir los gráficos de la pestaña de correlaciones
+# Se cachean como dict por filtros para no repetir la construcción de
+# Plotly Express en cada rerun
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def build_scatter_figures(_df, min_p, max_p, ocupacion, comarca, barrios):
+    plot_df = load_plot_sample(_df, min_p, max_p, ocupacion, comarca, barrios)
+    stats = dataset_stats()
+    estilo = dict(
+        color="Occupancy",
+        color_discrete_map=stats['colores_ocupacion'],
+        category_orders={"Occupancy": list(stats['opciones']['Occupancy'])},
+        render_mode='webgl'
+    )
+    fig_scatter = px.scatter(
+        plot_df[['Price', 'Rentability Index', 'Occupancy']],
+        x="Price",
+        y="Rentability Index",
+        title="Rentabilidad vs Precio",
+        labels={"Price": "Precio (¥)", "Rentability Index": "Índice de Rentabilidad", "Occupancy": "Ocupación"},
+        **estilo
+    )
+    fig_size = px.scatter(
+        plot_df[['Size', 'Price', 'Occupancy']],
+        x="Size",
+        y="Price",
+        title="Precio vs Tamaño",
+        labels={"Size": "Tamaño (m²)", "Price": "Precio (¥)", "Occupancy": "Ocupación"},
+        **estilo
+    )
+    for fig in (fig_scatter, fig_size):
+        # Puntos pequeños y semitransparentes para reducir el solapamiento
+        fig.update_traces(marker=dict(size=4, opacity=0.5))
+        fig.update_layout(hovermode='closest')
+    return fig_scatter.to_dict(), fig_size.to_dict()
+
+# Función para crear un histograma con los bins calculados en el servidor
+# Se envían al navegador 50 barras en lugar de todos los valores
+def histogram_figure(counts, edges, title, x_label):
+    fig = go.Figure(go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges)))
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_label,
+        yaxis_title="Cantidad",
+        showlegend=False
+    )
+    return fig
+
+# Paleta Viridis de Plotly interpolada a 256 colores RGB
+def viridis_lut():
+    paleta = np.array([hex_to_rgb(c) for c in px.colors.sequential.Viridis], dtype=np.float64)
+    posiciones = np.linspace(0, 1, len(paleta))
+    return np.stack(
+        [np.interp(np.linspace(0, 1, 256), posiciones, paleta[:, i]) for i in range(3)],
+        axis=1
+    ).astype(np.uint8)
+
+# Función para rasterizar el mapa en el servidor cuando hay muchos puntos
+# Cada celda se colorea con la rentabilidad media de sus propiedades y se
+# envía al navegador una sola imagen PNG en lugar de un punto por propiedad,
+# junto con las propiedades más rentables ya formateadas para el tooltip
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def map_raster(_df, min_p, max_p, ocupacion, comarca, barrios):
+    df = _df.dropna(subset=['lat', 'lon'])
+    if df.empty:
+        return None
+    lat = df['lat'].to_numpy(dtype=np.float64)
+    lon = df['lon'].to_numpy(dtype=np.float64)
+    rentabilidad = df['Rentability Index'].to_numpy(dtype=np.float64)
+    # Margen para que el rango no sea nulo si todos los puntos coinciden
+    margen = 1e-4
+    rango = [[lat.min() - margen, lat.max() + margen], [lon.min() - margen, lon.max() + margen]]
+    ancho, alto = MAP_RASTER_SIZE
+    suma, _, _ = np.histogram2d(lat, lon, bins=(alto, ancho), range=rango, weights=rentabilidad)
+    cuenta, _, _ = np.histogram2d(lat, lon, bins=(alto, ancho), range=rango)
+    con_datos = cuenta > 0
+    media = np.zeros_like(suma)
+    media[con_datos] = suma[con_datos] / cuenta[con_datos]
+    vmin, vmax = media[con_datos].min(), media[con_datos].max()
+    lut = viridis_lut()
+    indices = np.zeros(media.shape, dtype=np.uint8)
+    if vmax > vmin:
+        indices = np.round((media - vmin) / (vmax - vmin) * 255).astype(np.uint8)
+    rgba = np.zeros((alto, ancho, 4), dtype=np.uint8)
+    rgba[..., :3] = lut[indices]
+    rgba[..., 3] = np.where(con_datos, 220, 0)
+    # La fila 0 de la imagen corresponde al norte
+    buffer = io.BytesIO()
+    Image.fromarray(np.flipud(rgba), 'RGBA').save(buffer, format='PNG')
+    imagen = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode()
+    # Límites [oeste, sur, este, norte] para el BitmapLayer
+    bounds = [float(v) for v in (rango[1][0], rango[0][0], rango[1][1], rango[0][1])]
+    # Las propiedades más rentables como puntos, para poder ver sus datos
+    top_df = df.nlargest(MAP_TOP_POINTS, 'Rentability Index')
+    puntos = pd.DataFrame({
+        'lat': top_df['lat'].astype('float64'),
+        'lon': top_df['lon'].astype('float64'),
+        'direccion': top_df['Address'].astype(str),
+        'precio': top_df['Price'].map('¥{:,.0f}'.format),
+        'rentabilidad': top_df['Rentability Index'].map('{:.2%}'.format),
+    })
+    return imagen, bounds, float(vmin), float(vmax), puntos
+
+# Función para calcular el centro del mapa de la selección
+# Si la selección incluye más de la mitad de las propiedades se usa el
+# centro global, que ya viene calculado con los filtros
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def map_center(_df, min_p, max_p, ocupacion, comarca, barrios):
+    stats = dataset_stats()
+    if stats['centro'] is not None and len(_df) > 0.5 * stats['medias']['n']:
+        return stats['centro']
+    lat = _df['lat'].to_numpy(dtype=np.float32)
+    lon = _df['lon'].to_numpy(dtype=np.float32)
+    con_coordenadas = ~(np.isnan(lat) | np.isnan(lon))
+    n = np.count_nonzero(con_coordenadas)
+    if not n:
+        return stats['centro']
+    return (
+        float(np.add.reduce(lat[con_coordenadas], dtype=np.float64) / n),
+        float(np.add.reduce(lon[con_coordenadas], dtype=np.float64) / n),
+    )
+
+# Página del mapa de puntos: deck.gl recibe cada columna como un buffer
+# binario (typed array) en lugar de un objeto JSON por punto.
+# deck.gl se carga con versión fija y hash de integridad (SRI); si no carga,
+# se muestra un aviso en lugar de un mapa en blanco. Las teselas de
+# OpenStreetMap requieren mostrar su atribución
+MAP_HTML = """
+<div style="position: relative; width: 100%; height: 600px;">
+    <div id="mapa" style="position: absolute; inset: 0;"></div>
+    <div style="position: absolute; right: 0; bottom: 0; z-index: 1; padding: 2px 6px;
+                background: rgba(255, 255, 255, 0.8); font: 12px sans-serif;">
+        © <a href="https://www.openstreetmap.org/copyright" target="_blank" rel="noopener">OpenStreetMap</a> contributors
+    </div>
+</div>
+<script src="https://cdn.jsdelivr.net/npm/deck.gl@9.1.14/dist.min.js"
+        integrity="sha384-9Qz9Vg68oxSJ8alpsDVG3eFNLSZ8P16UxKNQyVheKTcnTlbnueGTD7D0MRd6Na0z"
+        crossorigin="anonymous"
+        onerror="document.getElementById('mapa').textContent = 'No se pudo cargar deck.gl.'"></script>
+<script>
+const datos = __DATOS__;
+const leer = (b64, Tipo) => new Tipo(Uint8Array.from(atob(b64), c => c.charCodeAt(0)).buffer);
+const posicion = leer(datos.posicion, Float32Array);
+const color = leer(datos.color, Uint8Array);
+const radio = leer(datos.radio, Float32Array);
+const precio = leer(datos.precio, Float64Array);
+const rentabilidad = leer(datos.rentabilidad, Float32Array);
+const payback = leer(datos.payback, Float32Array);
+// Direcciones: offsets int32 sobre un único bloque de bytes UTF-8
+const offsets = leer(datos.direccion_offsets, Int32Array);
+const texto = leer(datos.direccion_texto, Uint8Array);
+const decoder = new TextDecoder();
+const direccion = i => decoder.decode(texto.subarray(offsets[i], offsets[i + 1]));
+new deck.DeckGL({
+    container: 'mapa',
+    initialViewState: {latitude: __LAT__, longitude: __LON__, zoom: 10},
+    controller: true,
+    layers: [
+        new deck.TileLayer({
+            data: 'https://tile.openstreetmap.org/{z}/{x}/{y}.png',
+            minZoom: 0,
+            maxZoom: 19,
+            tileSize: 256,
+            renderSubLayers: props => {
+                const [[oeste, sur], [este, norte]] = props.tile.boundingBox;
+                return new deck.BitmapLayer(props, {
+                    data: null,
+                    image: props.data,
+                    bounds: [oeste, sur, este, norte]
+                });
+            }
+        }),
+        new deck.ScatterplotLayer({
+            id: 'puntos',
+            data: {
+                length: radio.length,
+                attributes: {
+                    getPosition: {value: posicion, size: 2},
+                    getFillColor: {value: color, size: 3},
+                    getRadius: {value: radio, size: 1}
+                }
+            },
+            radiusUnits: 'pixels',
+            opacity: 0.8,
+            pickable: true
+        })
+    ],
+    getTooltip: ({layer, index}) => layer && index >= 0 && (
+        direccion(index) +
+        '\\nPrecio: ¥' + Math.round(precio[index]).toLocaleString('en-US') +
+        '\\nRentabilidad: ' + (rentabilidad[index] * 100).toFixed(2) + '%' +
+        '\\nRecuperación: ' + payback[index].toFixed(1) + ' años'
+    )
+});
+</script>
+"""
+
+# Función para preparar los puntos del mapa como buffers binarios por columna
+# Color y radio se calculan aquí, igual que hacía Plotly con color y size
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def map_buffers(_df, min_p, max_p, ocupacion, comarca, barrios):
+    df = load_plot_sample(_df, min_p, max_p, ocupacion, comarca, barrios)
+    df = df.dropna(subset=['lat', 'lon'])
+    if df.empty:
+        return None
+    # load_filtered ya rellena los nulos de precio, rentabilidad y payback
+    rentabilidad = df['Rentability Index'].to_numpy(dtype=np.float64)
+    precio = df['Price'].to_numpy(dtype=np.float64)
+    vmin, vmax = rentabilidad.min(), rentabilidad.max()
+    indices = np.zeros(len(df), dtype=np.uint8)
+    if vmax > vmin:
+        indices = np.round((rentabilidad - vmin) / (vmax - vmin) * 255).astype(np.uint8)
+    colores = viridis_lut()[indices]
+    # Área proporcional al precio, hasta 10 px de radio
+    radio = np.zeros(len(df))
+    if precio.max() > 0:
+        radio = np.sqrt(np.maximum(precio, 0) / precio.max()) * 10
+    direcciones = [d.encode() for d in df['Address'].astype(str)]
+    offsets = np.zeros(len(direcciones) + 1, dtype=np.int32)
+    offsets[1:] = np.cumsum([len(d) for d in direcciones])
+    columnas = {
+        # [lon, lat] intercalados, como espera getPosition
+        'posicion': np.column_stack([df['lon'], df['lat']]).astype(np.float32).tobytes(),
+        'color': colores.tobytes(),
+        'radio': np.maximum(radio, 2).astype(np.float32).tobytes(),
+        'precio': precio.tobytes(),
+        'rentabilidad': rentabilidad.astype(np.float32).tobytes(),
+        'payback': df['Payback Period'].to_numpy(dtype=np.float32).tobytes(),
+        'direccion_offsets': offsets.tobytes(),
+        'direccion_texto': b''.join(direcciones),
+    }
+    datos = {c: base64.b64encode(v).decode() for c, v in columnas.items()}
+    return json.dumps(datos), float(vmin), float(vmax)
+
+# Función para obtener las filas de la tabla de detalle
+# La consulta no tiene orden, así que se ordenan por precio (y dirección en
+# caso de empate) antes de recortar: siempre se muestran las mismas filas
+@st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def load_table_rows(_df, min_p, max_p, ocupacion, comarca, barrios):
+    return _df.sort_values(
+        ['Price', 'Address'], ascending=[False, True], kind='stable'
+    ).head(MAX_TABLE_ROWS)
+
+# Función para construir las opciones del slider de precios
+# Se cachea por rango para no recalcularlas en cada interacción
+@st.cache_data
+def price_slider_options(min_price, max_price, num_steps=100):
+    # Crear rangos logarítmicos para los precios
+    # Añadimos 1 al precio mínimo para evitar log(0)
+    log_min = np.log10(min_price + 1)
+    log_max = np.log10(max_price)
+    # np.unique ordena y elimina duplicados; se incluyen el mínimo y el máximo
+    price_values = np.unique(np.concatenate([
+        np.round(np.logspace(log_min, log_max, num_steps)).astype(np.int64),
+        [min_price, max_price]
+    ]))
+    # Crear las opciones del slider con el formato correcto
+    price_options = [f"¥{i:,.0f}" for i in price_values]
+    # Para traducir la opción elegida de vuelta a su valor
+    label_to_value = dict(zip(price_options, price_values.tolist()))
+    return price_values, price_options, label_to_value
+
+# Cargar valores de los filtros
+stats = dataset_stats()
 
 # Validar datos cargados
-if df.empty:
+if stats is None:
     st.error("No se pudieron cargar datos. Verifique la conexión a la base de datos.")
     st.stop()
 
-# Manejo de valores nulos
-df['Occupancy'] = df['Occupancy'].fillna('Unknown').fillna('Sin especificar')
-df['Price'] = df['Price'].fillna(0)
-df['Rentability Index'] = df['Rentability Index'].fillna(0)
-df['Payback Period'] = df['Payback Period'].fillna(0)
+# Medias globales para comparar en las métricas
+baselines = stats['medias']
+
+# Opciones de los filtros
+opciones = stats['opciones']
 
 # Sidebar con filtros
 st.sidebar.title("Filtros")
@@ -82,59 +665,50 @@ st.sidebar.title("Filtros")
 # Filtros dinámicos
 comarca = st.sidebar.selectbox(
     "Comarca",
-    options=["Todas"] + sorted(df['Comarca'].dropna().unique().tolist())
+    options=("Todas",) + opciones['Comarca']
 )
 
-# Crear un expander para los barrios
-with st.sidebar.expander("Seleccionar Barrios"):
-    # Checkbox para seleccionar/deseleccionar todos
-    select_all_barrios = st.checkbox("Seleccionar todos los barrios")
+# Lista de barrios disponibles
+barrios_disponibles = opciones['Barrio']
 
-    # Lista de barrios disponibles
-    barrios_disponibles = sorted(df['Barrio'].dropna().unique().tolist())
-    
-    # Crear un checkbox para cada barrio
-    barrios_seleccionados = []
-    for barrio in barrios_disponibles:
-        # Si es Shinjuku, marcarlo por defecto
-        default_value = True if barrio == "Shinjuku" else select_all_barrios
-        if st.checkbox(barrio, value=default_value, key=f"barrio_{barrio}"):
-            barrios_seleccionados.append(barrio)
-
-    # Asegurarse de que al menos un barrio está seleccionado
-    if not barrios_seleccionados:
-        st.warning("Por favor selecciona al menos un barrio")
-        if "Shinjuku" in barrios_disponibles:
-            barrios_seleccionados = ["Shinjuku"]
-        else:
-            barrios_seleccionados = [barrios_disponibles[0]]
+# Todos los barrios seleccionados por defecto
+if 'barrios' not in st.session_state:
+    st.session_state.barrios = list(barrios_disponibles)
 
-ocupacion = st.sidebar.multiselect(
-    "Estado de Ocupación",
-    options=sorted(df['Occupancy'].unique().tolist()),
-    default=sorted(df['Occupancy'].unique().tolist())
+# Un único multiselect en lugar de un checkbox por barrio
+barrios_seleccionados = st.sidebar.multiselect(
+    "Barrios",
+    options=barrios_disponibles,
+    key='barrios'
 )
 
-# Convertir los valores mínimos y máximos en enteros
-min_price = int(df['Price'].min() or 0)
-max_price = int(df['Price'].max() or 0)
+# Botón para vaciar la selección
+def deseleccionar_barrios():
+    st.session_state.barrios = []
 
-# Crear rangos logarítmicos para los precios
-# Usamos numpy logspace para crear una secuencia logarítmica
-# Añadimos 1 al precio mínimo para evitar log(0)
-log_min = np.log10(min_price + 1)
-log_max = np.log10(max_price)
-num_steps = 100  # Número de pasos en el slider
+st.sidebar.button("Deseleccionar todos", on_click=deseleccionar_barrios)
 
-# Crear los valores logarítmicos y redondearlos a números enteros
-price_values = np.round(np.logspace(log_min, log_max, num_steps)).astype(int)
-# Asegurarse de que el precio mínimo y máximo estén incluidos
-price_values = np.unique(np.append(price_values, [min_price, max_price]))
-# Ordenar los valores
-price_values.sort()
+# Asegurarse de que al menos un barrio está seleccionado
+if not barrios_seleccionados:
+    st.sidebar.warning("Por favor selecciona al menos un barrio")
+    if "Shinjuku" in barrios_disponibles:
+        barrios_seleccionados = ["Shinjuku"]
+    else:
+        barrios_seleccionados = [barrios_disponibles[0]]
+
+ocupaciones_disponibles = opciones['Occupancy']
+ocupacion = st.sidebar.multiselect(
+    "Estado de Ocupación",
+    options=ocupaciones_disponibles,
+    default=ocupaciones_disponibles
+)
+
+# Valores mínimo y máximo de precio, ya convertidos en enteros
+min_price = stats['min_price']
+max_price = stats['max_price']
 
-# Crear las opciones del slider con el formato correcto
-price_options = [f"¥{i:,.0f}" for i in price_values]
+# Valores y etiquetas del slider de precios
+price_values, price_options, label_to_value = price_slider_options(min_price, max_price)
 
 # Encontrar los índices más cercanos para los valores por defecto
 min_price_idx = np.searchsorted(price_values, min_price)
@@ -142,7 +716,7 @@ max_price_idx = np.searchsorted(price_values, max_price)
 
 # Usar los valores formateados correspondientes a estos índices
 default_min_price = price_options[min_price_idx]
-default_max_price = price_options[max_price_idx - 1]  # -1 para asegurarnos de que está en el rango
+default_max_price = price_options[max_price_idx]
 
 # Configurar el select_slider con opciones formateadas
 price_range = st.sidebar.select_slider(
@@ -151,133 +725,155 @@ price_range = st.sidebar.select_slider(
     value=(default_min_price, default_max_price)
 )
 
-# Parsear el rango seleccionado de vuelta a enteros
-selected_min_price = int(price_range[0].replace("¥", "").replace(",", ""))
-selected_max_price = int(price_range[1].replace("¥", "").replace(",", ""))
+# Traducir el rango seleccionado de vuelta a enteros
+selected_min_price = label_to_value[price_range[0]]
+selected_max_price = label_to_value[price_range[1]]
 
 
 
-# Aplicar filtros
-mask = df['Price'].between(selected_min_price, selected_max_price)
-mask &= df['Occupancy'].isin(ocupacion)
-if comarca != "Todas":
-    mask &= (df['Comarca'] == comarca)
-if barrios_seleccionados:  # Si hay barrios seleccionados
-    mask &= df['Barrio'].isin(barrios_seleccionados)
-
-filtered_df = df[mask]
+# Filtros seleccionados; las listas se ordenan para que la misma selección
+# use siempre la misma entrada de la caché, y None indica que está todo
+# seleccionado (también el rango de precio completo) para no enviar a
+# Postgres una condición que no descarta nada
+if (selected_min_price, selected_max_price) == (min_price, max_price):
+    rango_precio = (None, None)
+else:
+    rango_precio = (selected_min_price, selected_max_price)
+filtros = (
+    *rango_precio,
+    None if len(ocupacion) == len(ocupaciones_disponibles) else tuple(sorted(ocupacion)),
+    None if comarca == "Todas" else comarca,
+    None if len(barrios_seleccionados) == len(barrios_disponibles) else tuple(sorted(barrios_seleccionados))
+)
 
-# Título principal
+# Título principal; se pinta junto con el sidebar antes de la consulta
 st.title("🏠 Análisis de Propiedades Inmobiliarias")
 
-# Métricas principales
-col1, col2, col3, col4 = st.columns(4)
-
-with col1:
-    st.metric(
-        "Precio Promedio",
-        f"¥{filtered_df['Price'].mean():,.0f}" if not filtered_df.empty else "N/A",
-        f"{filtered_df['Price'].mean() / df['Price'].mean() - 1:+.1%}" if not filtered_df.empty else "N/A"
-    )
-
-with col2:
-    st.metric(
-        "Rentabilidad Media",
-        f"{filtered_df['Rentability Index'].mean():.2%}" if not filtered_df.empty else "N/A",
-        f"{filtered_df['Rentability Index'].mean() / df['Rentability Index'].mean() - 1:+.1%}" if not filtered_df.empty else "N/A"
-    )
-
-with col3:
-    st.metric(
-        "Propiedades",
-        f"{len(filtered_df):,}" if not filtered_df.empty else "0",
-        f"{len(filtered_df) / len(df) - 1:+.1%}" if not filtered_df.empty else "N/A"
-    )
-
-with col4:
-    st.metric(
-        "Periodo de Recuperación",
-        f"{filtered_df['Payback Period'].mean():.1f} años" if not filtered_df.empty else "N/A",
-        f"{filtered_df['Payback Period'].mean() / df['Payback Period'].mean() - 1:+.1%}" if not filtered_df.empty else "N/A"
+# Cargar solo las propiedades que cumplen los filtros
+with st.spinner("Cargando propiedades..."):
+    filtered_df = load_filtered(*filtros)
+    metricas = compute_metrics(filtered_df, *filtros)
+    histogramas = compute_histograms(filtered_df, *filtros)
+    # Plotly no acepta como dict una figura sin trazas; sin filas no se dibujan
+    figuras_dispersion = build_scatter_figures(filtered_df, *filtros) if not filtered_df.empty else None
+
+# Métricas principales, formateadas aquí y dibujadas en un solo bloque HTML
+if metricas['n']:
+    kpis = [
+        ("Precio Promedio", f"¥{metricas['price']:,.0f}", metricas['price'] / baselines['price'] - 1),
+        ("Rentabilidad Media", f"{metricas['rent']:.2%}", metricas['rent'] / baselines['rent'] - 1),
+        ("Propiedades", f"{metricas['n']:,}", metricas['n'] / baselines['n'] - 1),
+        ("Periodo de Recuperación", f"{metricas['payback']:.1f} años", metricas['payback'] / baselines['payback'] - 1),
+    ]
+else:
+    kpis = [
+        ("Precio Promedio", "N/A", None),
+        ("Rentabilidad Media", "N/A", None),
+        ("Propiedades", "0", None),
+        ("Periodo de Recuperación", "N/A", None),
+    ]
+
+tarjetas = []
+for label, valor, delta in kpis:
+    if delta is None:
+        delta_html = '<div>N/A</div>'
+    else:
+        clase = 'delta-up' if delta >= 0 else 'delta-down'
+        delta_html = f'<div class="{clase}">{delta:+.1%}</div>'
+    tarjetas.append(
+        f'<div class="metric-card"><div>{label}</div>'
+        f'<div class="big-number">{valor}</div>{delta_html}</div>'
     )
+st.markdown(f'<div class="kpi-row">{"".join(tarjetas)}</div>', unsafe_allow_html=True)
 
 # Gráficos
 st.header("Análisis de Mercado")
 
-tab1, tab2, tab3 = st.tabs(["Distribución", "Correlaciones", "Mapa"])
+# Con on_change="rerun" Streamlit sabe qué pestaña está abierta (.open);
+# el mapa solo se calcula y se envía cuando se abre su pestaña
+tab1, tab2, tab3 = st.tabs(["Distribución", "Correlaciones", "Mapa"], key="tab", on_change="rerun")
 
 with tab1:
     col1, col2 = st.columns(2)
     with col1:
-        fig_price = px.histogram(
-            filtered_df,
-            x="Price",
-            nbins=50,
-            title="Distribución de Precios",
-            labels={"Price": "Precio (¥)", "count": "Cantidad"}
+        fig_price = histogram_figure(
+            *histogramas['Price'],
+            "Distribución de Precios",
+            "Precio (¥)"
         )
-        fig_price.update_layout(showlegend=False)
         st.plotly_chart(fig_price, use_container_width=True)
     with col2:
-        fig_rent = px.histogram(
-            filtered_df,
-            x="Rentability Index",
-            nbins=50,
-            title="Distribución de Rentabilidad",
-            labels={"Rentability Index": "Índice de Rentabilidad", "count": "Cantidad"}
+        fig_rent = histogram_figure(
+            *histogramas['Rentability Index'],
+            "Distribución de Rentabilidad",
+            "Índice de Rentabilidad"
         )
-        fig_rent.update_layout(showlegend=False)
         st.plotly_chart(fig_rent, use_container_width=True)
 
 with tab2:
-    col1, col2 = st.columns(2)
-    with col1:
-        fig_scatter = px.scatter(
-            filtered_df,
-            x="Price",
-            y="Rentability Index",
-            color="Occupancy",
-            title="Rentabilidad vs Precio",
-            labels={"Price": "Precio (¥)", "Rentability Index": "Índice de Rentabilidad", "Occupancy": "Ocupación"}
-        )
-        st.plotly_chart(fig_scatter, use_container_width=True)
-    with col2:
-        fig_size = px.scatter(
-            filtered_df,
-            x="Size",
-            y="Price",
-            color="Occupancy",
-            title="Precio vs Tamaño",
-            labels={"Size": "Tamaño (m²)", "Price": "Precio (¥)", "Occupancy": "Ocupación"}
-        )
-        st.plotly_chart(fig_size, use_container_width=True)
-
-with tab3:
-    if not filtered_df.empty:
-        fig_map = px.scatter_mapbox(
-            filtered_df,
-            lat='lat',
-            lon='lon',
-            color='Rentability Index',
-            size='Price',
-            hover_name='Address',
-            hover_data={'Price': ':,.0f', 'Rentability Index': ':.2%', 'Payback Period': ':.1f'},
-            color_continuous_scale='Viridis',
-            zoom=10,
-            title="Mapa de Propiedades",
-            mapbox_style="open-street-map"
-        )
-        fig_map.update_layout(
-            height=600,
-            mapbox=dict(center=dict(lat=filtered_df['lat'].mean(), lon=filtered_df['lon'].mean()))
-        )
-        st.plotly_chart(fig_map, use_container_width=True)
+    if figuras_dispersion is not None:
+        col1, col2 = st.columns(2)
+        with col1:
+            st.plotly_chart(figuras_dispersion[0], use_container_width=True)
+        with col2:
+            st.plotly_chart(figuras_dispersion[1], use_container_width=True)
     else:
         st.warning("No hay propiedades que coincidan con los filtros seleccionados.")
 
-if 'column_order' not in st.session_state:
-    st.session_state.column_order = ['Address', 'Price', 'Size', 'Rentability Index', 'Payback Period', 'Link']
-
+with tab3:
+    if tab3.open:
+        if not filtered_df.empty:
+            raster = map_raster(filtered_df, *filtros) if len(filtered_df) > MAX_PLOT_POINTS else None
+            if raster is not None:
+                imagen, bounds, vmin, vmax, puntos = raster
+                deck = pdk.Deck(
+                    layers=[
+                        pdk.Layer('BitmapLayer', image=imagen, bounds=bounds, opacity=0.8),
+                        pdk.Layer(
+                            'ScatterplotLayer',
+                            data=puntos,
+                            get_position='[lon, lat]',
+                            get_radius=40,
+                            radius_min_pixels=3,
+                            get_fill_color=[255, 80, 0, 220],
+                            pickable=True
+                        ),
+                    ],
+                    initial_view_state=pdk.ViewState(
+                        latitude=(bounds[1] + bounds[3]) / 2,
+                        longitude=(bounds[0] + bounds[2]) / 2,
+                        zoom=10
+                    ),
+                    map_provider='carto',
+                    map_style='light',
+                    tooltip={'text': '{direccion}\n{precio}\nRentabilidad: {rentabilidad}'}
+                )
+                st.subheader("Mapa de Propiedades")
+                st.pydeck_chart(deck, use_container_width=True)
+                st.caption(
+                    f"Color: rentabilidad media por zona, de {vmin:.2%} a {vmax:.2%}. "
+                    f"Puntos: las {MAP_TOP_POINTS} propiedades más rentables."
+                )
+            else:
+                puntos = map_buffers(filtered_df, *filtros)
+                centro = map_center(filtered_df, *filtros)
+                if puntos is not None and centro is not None:
+                    datos, vmin, vmax = puntos
+                    st.subheader("Mapa de Propiedades")
+                    st.iframe(
+                        MAP_HTML.replace('__DATOS__', datos)
+                        .replace('__LAT__', repr(centro[0]))
+                        .replace('__LON__', repr(centro[1])),
+                        height=610
+                    )
+                    st.caption(
+                        f"Color: rentabilidad, de {vmin:.2%} a {vmax:.2%}. "
+                        "Tamaño: precio."
+                    )
+                else:
+                    st.warning("Ninguna de las propiedades seleccionadas tiene coordenadas.")
+        else:
+            st.warning("No hay propiedades que coincidan con los filtros seleccionados.")
 
 # Tabla de datos detallados
 st.header("Propiedades Detalladas")
@@ -289,20 +885,34 @@ cols_to_show = st.multiselect(
 )
 
 if not filtered_df.empty:
-    # Preparar los datos
-    df_display = filtered_df[cols_to_show].copy()
-    
-    # Formatear las columnas numéricas
-    if 'Price' in df_display.columns:
-        df_display['Price'] = df_display['Price'].apply(lambda x: f"¥{float(x):,.0f}" if pd.notnull(x) else "")
-    if 'Rentability Index' in df_display.columns:
-        df_display['Rentability Index'] = df_display['Rentability Index'].apply(lambda x: f"{float(x):.2%}" if pd.notnull(x) else "")
-    if 'Payback Period' in df_display.columns:
-        df_display['Payback Period'] = df_display['Payback Period'].apply(lambda x: f"{float(x):.1f}" if pd.notnull(x) else "")
+    # Preparar los datos; la tabla se envía completa al navegador, así que se
+    # limita el número de filas
+    df_display = load_table_rows(filtered_df, *filtros)[cols_to_show]
+    if len(filtered_df) > MAX_TABLE_ROWS:
+        st.caption(
+            f"Mostrando las {MAX_TABLE_ROWS:,} propiedades más caras de {len(filtered_df):,}. "
+            "La ordenación y los filtros de la tabla se aplican solo a estas filas."
+        )
     
     # Configurar AgGrid
     gb = GridOptionsBuilder.from_dataframe(df_display)
-    gb.configure_columns(cols_to_show, suppressMovable=False)  # Permitir mover columnas
+    # Mover, ordenar, redimensionar y filtrar columnas en el navegador, sin rerun
+    gb.configure_default_column(resizable=True, sortable=True, filter=True, suppressMovable=False)
+    # Formatear las columnas numéricas en el navegador, solo para las celdas visibles
+    value_formatters = {
+        'Price': JsCode("""
+        function(params) {return params.value == null ? '' : '¥' + Math.round(params.value).toLocaleString('en-US')}
+        """),
+        'Rentability Index': JsCode("""
+        function(params) {return params.value == null ? '' : (params.value * 100).toFixed(2) + '%'}
+        """),
+        'Payback Period': JsCode("""
+        function(params) {return params.value == null ? '' : Number(params.value).toFixed(1)}
+        """),
+    }
+    for col, formatter in value_formatters.items():
+        if col in df_display.columns:
+            gb.configure_column(col, type=['numericColumn'], valueFormatter=formatter)
     # Configuración especial para la columna de links
     if 'Link' in df_display.columns:
         # Definir el renderizador de JavaScript
@@ -311,9 +921,6 @@ if not filtered_df.empty:
         """)
         gb.configure_column('Link', cellRenderer=cell_renderer,suppressMovable=False)
     
-    # Aplicar configuraciones al resto de las columnas
-
-    
     grid_options = gb.build()
     
     # Mostrar AgGrid
@@ -0,0 +1,54 @@
+import os
+import sys
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+from sqlalchemy import create_engine
+
+# Genera el snapshot Parquet de la tabla properties que lee dashboard.py
+# Uso: python refresh_snapshot.py [ruta]
+# Por defecto se escribe en la ruta de los secrets ([snapshot] path = "...")
+
+# Columnas numéricas que se guardan como float32 (los importes en yenes
+# se mantienen en float64, igual que en el dashboard)
+FLOAT32_COLUMNS = ('Size', 'Rentability Index', 'Payback Period', 'lat', 'lon')
+# Columnas de pocos valores distintos, con codificación de diccionario
+DICTIONARY_COLUMNS = ['Comarca', 'Barrio', 'Occupancy']
+
+
+def main():
+    if len(sys.argv) > 1:
+        ruta = sys.argv[1]
+    else:
+        ruta = st.secrets["snapshot"]["path"]
+
+    credentials = st.secrets["postgres"]
+    connection_string = (
+        f"postgresql://{credentials['user']}:{credentials['password']}@"
+        f"{credentials['host']}:{credentials['port']}/{credentials['database']}"
+    )
+    engine = create_engine(connection_string)
+    df = pd.read_sql('SELECT * FROM properties', engine)
+
+    # Los mismos valores por defecto que aplica el dashboard, para poder
+    # filtrar directamente sobre el fichero
+    df['Occupancy'] = df['Occupancy'].fillna('Unknown')
+    df['Price'] = df['Price'].fillna(0)
+    df = df.astype({c: 'float32' for c in FLOAT32_COLUMNS if c in df.columns})
+
+    # Se escribe en un fichero temporal y se renombra, para que el dashboard
+    # nunca lea un snapshot a medio escribir
+    tmp = ruta + '.tmp'
+    pq.write_table(
+        pa.Table.from_pandas(df, preserve_index=False),
+        tmp,
+        use_dictionary=DICTIONARY_COLUMNS,
+        compression='zstd'
+    )
+    os.replace(tmp, ruta)
+    print(f"Snapshot escrito en {ruta}: {len(df):,} propiedades")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,28 @@
+-- Coordenadas como columnas numéricas en lugar del texto "lat,lon"
+-- El dashboard lee lat/lon directamente; ejecutar una vez sobre la base de datos
+
+ALTER TABLE properties
+    ADD COLUMN IF NOT EXISTS lat DOUBLE PRECISION,
+    ADD COLUMN IF NOT EXISTS lon DOUBLE PRECISION;
+
+-- Mantener lat/lon sincronizadas con "Coordinates" en cada carga
+CREATE OR REPLACE FUNCTION properties_split_coordinates() RETURNS trigger AS $$
+BEGIN
+    IF NEW."Coordinates" ~ '^\s*-?\d+\.?\d*\s*,\s*-?\d+\.?\d*\s*$' THEN
+        NEW.lat := split_part(NEW."Coordinates", ',', 1)::float8;
+        NEW.lon := split_part(NEW."Coordinates", ',', 2)::float8;
+    ELSE
+        NEW.lat := NULL;
+        NEW.lon := NULL;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS properties_split_coordinates ON properties;
+CREATE TRIGGER properties_split_coordinates
+    BEFORE INSERT OR UPDATE OF "Coordinates" ON properties
+    FOR EACH ROW EXECUTE FUNCTION properties_split_coordinates();
+
+-- Rellenar las filas existentes (el trigger calcula lat/lon)
+UPDATE properties SET "Coordinates" = "Coordinates";
@@ -0,0 +1,16 @@
+-- Índices para los filtros del dashboard
+-- Postgres lee cada índice como un bitmap de filas (Bitmap Index Scan) y los
+-- combina con BitmapAnd/BitmapOr, así que no hace falta precalcular máscaras
+-- por valor en la aplicación. Las expresiones deben coincidir con las de
+-- properties_query en dashboard.py para que el planificador use los índices
+
+CREATE INDEX IF NOT EXISTS properties_occupancy_idx
+    ON properties ((COALESCE("Occupancy", 'Unknown')));
+CREATE INDEX IF NOT EXISTS properties_comarca_idx
+    ON properties ("Comarca");
+CREATE INDEX IF NOT EXISTS properties_barrio_idx
+    ON properties ("Barrio");
+CREATE INDEX IF NOT EXISTS properties_price_idx
+    ON properties ((COALESCE("Price", 0)));
+
+ANALYZE properties;